@@ -1,44 +1,158 @@
 from __future__ import annotations
 import asyncio
+import time
 from typing import List, Optional, Tuple
+
+import aiohttp
+
 from .gofile_api import GofileClient
 
+# How long a cached usage probe stays fresh before we re-ask the API
+USAGE_TTL_SECONDS = 45.0
+EXHAUSTED_THRESHOLD = 0.995
+
 class AccountPool:
-    def __init__(self, tokens: List[str]):
+    def __init__(
+        self,
+        tokens: List[str],
+        usage_ttl: float = USAGE_TTL_SECONDS,
+        session: Optional[aiohttp.ClientSession] = None,
+    ):
         self.tokens = tokens[:]
         self._idx = 0
-        self._lock = asyncio.Lock()
         self._exhausted = set()
+        self._usage_ttl = usage_ttl
+        # idx -> (fetched_at, used, limit); missing/stale entries trigger a re-probe
+        self._usage: dict[int, Tuple[float, Optional[int], Optional[int]]] = {}
+        # token -> account id; immutable per token, so fetch once and reuse
+        self._account_ids: dict[str, str] = {}
+        # idx -> bytes uploaded since the last server probe (optimistic usage)
+        self._pending: dict[int, int] = {}
+        self._session = session
+        self._owned_session = False
+
+    def set_session(self, session: aiohttp.ClientSession):
+        """Adopt a process-wide session (owned and closed by the caller)."""
+        self._session = session
+        self._owned_session = False
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating a fallback one if none was injected."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=3600))
+            self._owned_session = True
+        return self._session
+
+    async def close(self):
+        if self._owned_session and self._session and not self._session.closed:
+            await self._session.close()
+
+    def _cached_exhausted(self, idx: int) -> Optional[bool]:
+        """Answer from cache only: True/False if fresh, None if missing or stale."""
+        entry = self._usage.get(idx)
+        if not entry:
+            return None
+        ts, used, limit = entry
+        if time.monotonic() - ts > self._usage_ttl:
+            return None
+        if used is None or limit is None or limit == 0:
+            return False  # probed recently, usage unknown → treat as usable
+        # Count bytes we already pushed since the probe, without re-asking the API
+        used += self._pending.get(idx, 0)
+        return (used / limit) >= EXHAUSTED_THRESHOLD
+
+    async def _probe(self, idx: int) -> Optional[bool]:
+        """Fetch fresh usage for one token and cache it. Runs outside the lock."""
+        session = await self._get_session()
+        client = self._client(idx, session)
+        try:
+            info = await client.get_account_info()
+            used, limit = client._extract_usage(info) if info else (None, None)
+            if client._account_id:
+                self._account_ids[self.tokens[idx]] = client._account_id
+        except Exception:
+            used, limit = None, None
+        self._usage[idx] = (time.monotonic(), used, limit)
+        self._pending[idx] = 0  # fresh server numbers supersede local increments
+        if used is None or limit is None or limit == 0:
+            return None
+        return (used / limit) >= EXHAUSTED_THRESHOLD
+
+    def _next_candidate(self) -> int:
+        """Bump the round-robin cursor. No awaits → atomic on the event loop."""
+        n = len(self.tokens)
+        start = self._idx % n
+        self._idx = (start + 1) % n
+        return start
+
+    def _client(self, idx: int, session) -> GofileClient:
+        token = self.tokens[idx]
+        return GofileClient(token, session=session, account_id=self._account_ids.get(token))
+
+    async def pick_healthy(self) -> Optional[Tuple[int, GofileClient]]:
+        """Next account that does not look exhausted, or None when they all do.
+
+        Unlike pick() this never hands back a known-bad slot, so rotation
+        loops can stop without paying for a doomed upload attempt."""
+        n = len(self.tokens)
+        start = self._next_candidate()
+        order = [(start + i) % n for i in range(n)]
+
+        session = await self._get_session()
+
+        # Pass 1: pure in-memory scan over fresh cache entries — no I/O
+        stale: list[int] = []
+        for idx in order:
+            cached = self._cached_exhausted(idx)
+            if cached is False:
+                self._exhausted.discard(idx)
+                return idx, self._client(idx, session)
+            if cached is None:
+                stale.append(idx)
+
+        # Pass 2: fan out probes for stale/missing entries and grab the first
+        # usable account — 1×RTT instead of N sequential round-trips
+        if stale:
+            async def _probe_one(i: int):
+                return i, await self._probe(i)
+
+            tasks = [asyncio.ensure_future(_probe_one(i)) for i in stale]
+            try:
+                for fut in asyncio.as_completed(tasks):
+                    idx, status = await fut
+                    if status is False:
+                        self._exhausted.discard(idx)
+                        return idx, self._client(idx, session)
+                    if status is None and idx not in self._exhausted:
+                        # usage unknown but never flagged — worth an attempt
+                        return idx, self._client(idx, session)
+                    if status is True:
+                        self._exhausted.add(idx)
+            finally:
+                for t in tasks:
+                    if not t.done():
+                        t.cancel()
+        return None
 
     async def pick(self) -> Tuple[int, GofileClient]:
         """Return (index, client) for the next usable account; round-robin with exhaustion check."""
-        async with self._lock:
-            n = len(self.tokens)
-            tried = 0
-            while tried < n:
-                idx = self._idx % n
-                token = self.tokens[idx]
-                client = GofileClient(token)
-                # Check if quota exhausted (best-effort)
-                async with client as c:
-                    status = await c.is_quota_exhausted()
-                if status is False or status is None:
-                    # good to use (or unknown) → accept
-                    chosen = idx
-                    self._idx = (idx + 1) % n
-                    return chosen, GofileClient(token)
-                else:
-                    # exhausted
-                    self._exhausted.add(idx)
-                    self._idx = (idx + 1) % n
-                    tried += 1
-            # If we reach here, all seem exhausted — return current index anyway
-            idx = self._idx % n
-            return idx, GofileClient(self.tokens[idx])
+        picked = await self.pick_healthy()
+        if picked is not None:
+            return picked
+        # Everything looks exhausted — hand back the cursor slot anyway
+        idx = self._idx % len(self.tokens)
+        return idx, self._client(idx, await self._get_session())
+
+    def record_bytes(self, idx: int, nbytes: int):
+        """Credit an upload against the cached quota so pick() stays accurate
+        between server probes."""
+        self._pending[idx] = self._pending.get(idx, 0) + nbytes
 
     async def mark_exhausted(self, idx: int):
-        async with self._lock:
-            self._exhausted.add(idx)
+        # Plain mutations — no awaits in between, so no lock is needed
+        self._exhausted.add(idx)
+        # Drop the cached probe so the next pick re-checks this slot
+        self._usage.pop(idx, None)
 
     def exhausted_indices(self):
         return sorted(self._exhausted)
@@ -1,24 +1,59 @@
 from __future__ import annotations
 
 import logging
+import re
 from telegram import Update
 from telegram.constants import MessageEntityType
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes
 from telegram.constants import ParseMode
 from telegram.ext import Defaults
+from . import config
 from .config import TELEGRAM_BOT_TOKEN, LOG_LEVEL, GOFILE_TOKENS, BOT_API_BASE_URL, MAX_CONCURRENT_TRANSFERS
 from .account_pool import AccountPool
 from .handlers import start, help_cmd, stats, handle_incoming_file
 import asyncio
 from telegram import LinkPreviewOptions
 
-# --- logging ---
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=getattr(logging, LOG_LEVEL, logging.INFO),
-)
+# libuv event loop: much cheaper call_soon/create_task, which the per-chunk
+# progress plumbing leans on heavily. Optional — absence just means the
+# stock selector loop.
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
+# --- logging (queued: the event loop never blocks on a stderr write) ---
+from .logsetup import setup as _setup_logging
+_setup_logging(LOG_LEVEL)
 log = logging.getLogger(__name__)
 
+# --- message filters (built once, reused across restarts) ---
+URL_RE = re.compile(r"https?://")
+
+# URL messages (text or captions) -> same handler
+URL_FILTER = (
+    (filters.TEXT & filters.Entity(MessageEntityType.URL)) |
+    (filters.TEXT & filters.Regex(URL_RE)) |
+    (filters.CAPTION & filters.CaptionEntity(MessageEntityType.URL)) |
+    (filters.CAPTION & filters.CaptionRegex(URL_RE))
+)
+
+# Files (document/video/audio/photo) -> same handler
+FILE_FILTER = (
+    filters.Document.ALL |
+    filters.VIDEO |
+    filters.AUDIO |
+    filters.PHOTO
+)
+
+
+# Bot-wide send defaults, built once
+DEFAULTS = Defaults(
+    parse_mode=ParseMode.HTML,
+    link_preview_options=LinkPreviewOptions(is_disabled=True),
+)
+
 
 # --- global error handler ---
 async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -30,43 +65,107 @@ async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
             pass
 
 
+async def _transfer_worker(queue: asyncio.Queue) -> None:
+    """Long-lived worker: pull one transfer job (a coroutine) at a time and run it."""
+    while True:
+        job = await queue.get()
+        try:
+            await job
+        except Exception:
+            log.exception("Transfer job failed")
+        finally:
+            queue.task_done()
+
+
+async def _post_init(app) -> None:
+    """Create the process-wide HTTP session and worker pool once the loop runs."""
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+
+    import aiohttp
+
+    # Bounded default executor: every asyncio.to_thread offload (disk writes,
+    # pwrite fan-out, cleanup) shares at most this many threads instead of
+    # the stock executor's per-burst growth
+    io_pool = ThreadPoolExecutor(
+        max_workers=min(32, (os.cpu_count() or 4) * 4),
+        thread_name_prefix="io",
+    )
+    asyncio.get_running_loop().set_default_executor(io_pool)
+    app.bot_data["io_pool"] = io_pool
+
+    session = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=3600),
+        connector=aiohttp.TCPConnector(limit=64, ttl_dns_cache=300, keepalive_timeout=75, force_close=False),
+    )
+    app.bot_data["http"] = session
+    app.bot_data["pool"].set_session(session)
+
+    # Warm the Pyrogram client while boot latency is invisible, so the first
+    # >20 MB media job doesn't pay MTProto auth + DC connect on its clock
+    from .pyro_client import API_HASH, API_ID, get_client
+    if API_ID and API_HASH:
+        try:
+            app.bot_data["pyro"] = await get_client()
+        except Exception:
+            log.warning("Pyrogram pre-warm failed; will connect lazily", exc_info=True)
+    else:
+        # Surface the gap at boot instead of on the first big file: without
+        # MTProto creds, >20 MB media on the public Bot API cannot be fetched
+        log.warning("API_ID / API_HASH not set — files over 20 MB will fail on the public Bot API")
+
+    # Bounded job queue + N workers: exact concurrency, FIFO fairness,
+    # backpressure when the backlog grows
+    queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+    app.bot_data["jobs"] = queue
+    app.bot_data["workers"] = [
+        asyncio.create_task(_transfer_worker(queue))
+        for _ in range(MAX_CONCURRENT_TRANSFERS)
+    ]
+
+
+async def _post_shutdown(app) -> None:
+    for worker in app.bot_data.get("workers", []):
+        worker.cancel()
+    session = app.bot_data.get("http")
+    if session and not session.closed:
+        await session.close()
+    from .http_clients import aclose as _close_httpx
+    await _close_httpx()
+    io_pool = app.bot_data.get("io_pool")
+    if io_pool is not None:
+        io_pool.shutdown(wait=False)
+
+
 def main():
+    config.validate()
+
     # 1) Build application
     pool = AccountPool(GOFILE_TOKENS)
 
-    defaults = Defaults(
-        parse_mode=ParseMode.HTML,
-        link_preview_options=LinkPreviewOptions(is_disabled=True),  # NEW
+    builder = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .defaults(DEFAULTS)
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
     )
-    
-    builder = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).defaults(defaults)
-    app = builder.build()
+    # Dispatch updates in parallel instead of PTB's sequential default
+    builder = builder.concurrent_updates(MAX_CONCURRENT_TRANSFERS)
     if BOT_API_BASE_URL:
         # Ensure trailing slash for PTB custom Bot API base URL
         builder = builder.base_url(BOT_API_BASE_URL.rstrip("/") + "/")
+        # Local Bot API server → HTTP/2 multiplexing cuts connection churn
+        builder = builder.http_version("2.0").get_updates_http_version("2.0")
 
     app = builder.build()
     app.bot_data["pool"] = pool  # used by handlers
 
-    app.bot_data["sem"] = asyncio.Semaphore(MAX_CONCURRENT_TRANSFERS)
-
     # 2) URL messages (text or captions) -> same handler
-    url_filter = (
-        (filters.TEXT & filters.Entity(MessageEntityType.URL)) |
-        (filters.TEXT & filters.Regex(r"https?://")) |
-        (filters.CAPTION & filters.CaptionEntity(MessageEntityType.URL)) |
-        (filters.CAPTION & filters.CaptionRegex(r"https?://"))
-    )
-    app.add_handler(MessageHandler(url_filter, handle_incoming_file))
+    app.add_handler(MessageHandler(URL_FILTER, handle_incoming_file))
 
     # 3) Files (document/video/audio/photo) -> same handler
-    file_filter = (
-        filters.Document.ALL |
-        filters.VIDEO |
-        filters.AUDIO |
-        filters.PHOTO
-    )
-    app.add_handler(MessageHandler(file_filter, handle_incoming_file))
+    app.add_handler(MessageHandler(FILE_FILTER, handle_incoming_file))
 
     # 4) Commands
     app.add_handler(CommandHandler("start", start))
@@ -77,7 +176,8 @@ def main():
     app.add_error_handler(on_error)
 
     log.info("Starting bot in polling mode…")
-    app.run_polling(close_loop=False)
+    # Long polling: one ~50s request instead of a tight poll loop
+    app.run_polling(timeout=50, poll_interval=0, close_loop=False)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,8 @@
 import os
 from dotenv import load_dotenv
 
-load_dotenv()
+# Parse the .env exactly once, at first import of this module
+_DOTENV_LOADED = load_dotenv()
 
 # Max bytes allowed for HTTP downloads (default 4 GB here; set what you need)
 MAX_HTTP_DOWNLOAD_MB = int(os.getenv("MAX_HTTP_DOWNLOAD_MB", "4096"))
@@ -22,8 +23,11 @@ USE_WEBHOOK = os.getenv("USE_WEBHOOK", "false").lower() in {"1", "true", "yes"}
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip()
 PORT = int(os.getenv("PORT", "8080"))
 
-if not TELEGRAM_BOT_TOKEN:
-    raise RuntimeError("Missing TELEGRAM_BOT_TOKEN")
+def validate() -> None:
+    """Check required credentials. Entrypoints call this once at startup so
+    merely importing the package (tests, tooling) never raises."""
+    if not TELEGRAM_BOT_TOKEN:
+        raise RuntimeError("Missing TELEGRAM_BOT_TOKEN")
 
-if not GOFILE_TOKENS:
-    raise RuntimeError("Provide at least one GoFile token via GOFILE_TOKENS separated by commas")
+    if not GOFILE_TOKENS:
+        raise RuntimeError("Provide at least one GoFile token via GOFILE_TOKENS separated by commas")
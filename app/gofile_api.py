@@ -1,50 +1,224 @@
 from __future__ import annotations
 
-import os, time, asyncio, inspect, json
+import os, time, asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, Optional, Tuple
 
 import aiohttp
+import orjson
 from aiohttp import MultipartWriter, payload
 
 API_BASE   = "https://api.gofile.io"
 UPLOAD_URL = "https://upload.gofile.io/uploadfile"  # global endpoint, no /getServer
 
+# Candidate field layouts for usage info — the API is BETA and renames fields.
+# Each entry: (container key, used-key candidates, limit-key candidates).
+_USAGE_PATHS = (
+    ("traffic",        ("used", "current", "value"), ("limit", "max", "quota")),
+    ("monthlyTraffic", ("used", "current", "value"), ("limit", "max", "quota")),
+    ("bandwidth",      ("used", "current", "value"), ("limit", "max", "quota")),
+)
+_FLAT_PAIRS = (
+    ("trafficUsed", "trafficLimit"),
+    ("monthlyTrafficUsed", "monthlyTrafficLimit"),
+)
+_NUM_TYPES = (int, float)
+
 # ---------- async file iterator ----------
 
-async def _iter_file(path: str, chunk_size: int = 4 * 1024 * 1024, on_chunk=None):
-    """Chunked async reader with optional progress callback (sync or async)."""
-    loop = asyncio.get_event_loop()
+# One transport write per chunk: 8 MiB keeps the syscall count low while the
+# sized payload (no chunked framing) lets aiohttp pass buffers through whole.
+# Tunable via GOFILE_CHUNK for boxes with different disk/NIC balances.
+UPLOAD_CHUNK_SIZE = int(os.getenv("GOFILE_CHUNK", 8 * 1024 * 1024))
+
+_SENTINEL = object()
+
+# Large files get a deeper read-ahead queue so the socket never waits on the
+# disk: Gofile's upload endpoint takes exactly one POST per file (no ranged
+# reassembly), so the way to keep a big transfer at line rate is a fatter
+# single-connection pipeline, not parallel range requests.
+_LARGE_FILE_BYTES = 64 * 1024 * 1024
+
+def _prefetch_depth(file_size: int) -> int:
+    return 8 if file_size > _LARGE_FILE_BYTES else 4
 
-    def _read(f, n):
-        return f.read(n)
+# Reader threads get their own tiny pool so multi-GB uploads never starve the
+# process-wide default executor shared with asyncio.to_thread callers
+_IO_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="gofile-io")
 
+async def _read_json(resp) -> Any:
+    """Decode a JSON response body straight from bytes via orjson."""
+    return orjson.loads(await resp.read())
+
+def _read_whole(path: str) -> bytes:
     with open(path, "rb") as f:
+        return f.read()
+
+async def _iter_file(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE, on_chunk=None, depth: int = 4):
+    """Chunked async reader with optional progress callback (sync or async).
+
+    One dedicated reader thread pre-fills a bounded queue, so the next chunk is
+    read from disk while the previous one is still being sent over the socket.
+    This deliberately avoids aiofiles: that would reintroduce one executor hop
+    per read, whereas a single thread issues back-to-back os.read calls.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+    # Raised when the consumer bails out early (aborted upload): the reader
+    # must stop at its next check instead of pumping the rest of a multi-GB
+    # file into discarded chunks — with only 2 pool workers, two orphaned
+    # full-file reads would wedge every later upload behind them
+    stop = threading.Event()
+
+    def _reader():
+        # One recycled read buffer; each queue item is an owned bytes of the
+        # exact length read (aiohttp may hold a chunk past the next readinto)
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        try:
+            with open(path, "rb", buffering=0) as f:
+                while not stop.is_set():
+                    n = f.readinto(buf)
+                    item = bytes(view[:n]) if n else _SENTINEL
+                    asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+                    if not n:
+                        return
+        except Exception as e:
+            asyncio.run_coroutine_threadsafe(queue.put(e), loop).result()
+
+    # Decide the callback flavour once, not per chunk
+    acb = on_chunk if (on_chunk and asyncio.iscoroutinefunction(on_chunk)) else None
+    cb = on_chunk if (on_chunk and acb is None) else None
+
+    reader = loop.run_in_executor(_IO_EXECUTOR, _reader)
+    try:
         while True:
-            chunk = await loop.run_in_executor(None, _read, f, chunk_size)
-            if not chunk:
+            chunk = await queue.get()
+            if chunk is _SENTINEL:
                 break
-            if on_chunk:
-                if inspect.iscoroutinefunction(on_chunk):
-                    await on_chunk(len(chunk))
-                else:
-                    try:
-                        on_chunk(len(chunk))
-                    except Exception:
-                        pass
+            if isinstance(chunk, Exception):
+                raise chunk
+            if acb:
+                await acb(len(chunk))
+            elif cb:
+                try:
+                    cb(len(chunk))
+                except Exception:
+                    pass
             yield chunk
+    finally:
+        # Tell the reader to quit, then unblock it (it may be parked on a
+        # full queue); it exits after at most one more in-flight chunk
+        stop.set()
+        while not reader.done():
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                await asyncio.sleep(0.01)
+        await reader
+
+class _SizedAsyncIterablePayload(payload.AsyncIterablePayload):
+    """AsyncIterablePayload with a known size.
+
+    With every part size known, MultipartWriter emits a plain Content-Length
+    request instead of Transfer-Encoding: chunked — no per-chunk framing, and
+    the server can preallocate.
+    """
+
+    def __init__(self, iterable, *, size: int, **kwargs):
+        super().__init__(iterable, **kwargs)
+        self._size = size
+
+class _CountedBytesPayload(payload.BytesPayload):
+    """BytesPayload that reports its bytes only when they are written.
+
+    Building the multipart body happens before the connection exists; the
+    callback must not fire until the payload actually goes out, or the
+    connect-failure retry (gated on bytes-sent == 0) could never trigger for
+    small files and the progress display would jump ahead of the wire.
+    """
+
+    def __init__(self, value: bytes, on_chunk, **kwargs):
+        super().__init__(value, **kwargs)
+        self._on_chunk = on_chunk
+
+    async def write(self, writer) -> None:
+        await super().write(writer)
+        self._on_chunk(self._size)
+
+class _UploadProgress:
+    """Counter plus the single long-lived status-edit task for one upload."""
+
+    __slots__ = ("sent", "_inv", "_status", "_evt", "_done")
+
+    def __init__(self, status, total: int):
+        self.sent = 0
+        self._inv = (100.0 / total) if total else 0.0  # one divide, hoisted
+        self._status = status
+        self._evt = asyncio.Event()
+        self._done = asyncio.Event()
+
+    def on_chunk(self, n: int) -> None:
+        self.sent += n
+        self._evt.set()
+
+    def finish(self) -> None:
+        self._done.set()
+        self._evt.set()
+
+    async def run(self) -> None:
+        while not self._done.is_set():
+            await self._evt.wait()
+            self._evt.clear()
+            if self._done.is_set():
+                break
+            try:
+                pct = min(self.sent * self._inv, 99.9)  # cap until server responds
+                await self._status.edit(f"⬆️ Uploading… {pct:.1f}%")
+            except Exception:
+                pass
+            await asyncio.sleep(2)  # rate-limit edits; counter keeps moving
+        # Terminal edit lives here so it is guaranteed to be the last one —
+        # no throttled percentage can land after it
+        try:
+            await self._status.edit("⬆️ Uploading… 100% (processing…)")
+        except Exception:
+            pass
 
 # ---------- client ----------
 
 class GofileClient:
-    def __init__(self, token: str, session: Optional[aiohttp.ClientSession] = None):
+    # pick() builds a client per candidate — keep instances dict-free and cheap
+    __slots__ = ("token", "session", "_owned_session", "_account_id", "_usage_cache")
+
+    def __init__(
+        self,
+        token: str,
+        session: Optional[aiohttp.ClientSession] = None,
+        account_id: Optional[str] = None,
+    ):
         self.token = token
         self.session = session
         self._owned_session = False
+        # account id is immutable per token — fetch at most once per client
+        self._account_id = account_id
+        # (monotonic ts, used, limit) from the last info fetch; short TTL
+        self._usage_cache: Optional[Tuple[float, Optional[int], Optional[int]]] = None
 
     async def __aenter__(self):
         if self.session is None:
             timeout = aiohttp.ClientTimeout(total=3600)
-            self.session = aiohttp.ClientSession(timeout=timeout)
+            # Keep connections to api.gofile.io warm so sequential metadata
+            # calls and the upload reuse one TLS session
+            connector = aiohttp.TCPConnector(
+                limit=64,
+                limit_per_host=16,
+                keepalive_timeout=300,
+                enable_cleanup_closed=True,
+            )
+            self.session = aiohttp.ClientSession(
+                timeout=timeout, connector=connector, read_bufsize=2**18
+            )
             self._owned_session = True
         return self
 
@@ -61,12 +235,15 @@ class GofileClient:
         return {"Authorization": f"Bearer {self.token}"}
 
     async def get_account_id(self) -> Optional[str]:
+        if self._account_id:
+            return self._account_id
         url = f"{API_BASE}/accounts/getid"
         async with self.session.get(url, headers=self._auth_headers()) as resp:
             if resp.status != 200:
                 return None
-            data = await resp.json(content_type=None)
-            return data.get("data") or data.get("accountId") or data.get("id")
+            data = await _read_json(resp)
+            self._account_id = data.get("data") or data.get("accountId") or data.get("id")
+            return self._account_id
 
     async def get_account_info(self, account_id: Optional[str] = None) -> Dict[str, Any]:
         if not account_id:
@@ -77,28 +254,35 @@ class GofileClient:
         async with self.session.get(url, headers=self._auth_headers()) as resp:
             if resp.status != 200:
                 return {}
-            return await resp.json(content_type=None)
+            return await _read_json(resp)
 
     @staticmethod
     def _extract_usage(info: Dict[str, Any]) -> Tuple[Optional[int], Optional[int]]:
         data = info.get("data", info)
-        traffic = data.get("traffic") or data.get("monthlyTraffic") or data.get("bandwidth")
-        if isinstance(traffic, dict):
-            used  = traffic.get("used") or traffic.get("current") or traffic.get("value")
-            limit = traffic.get("limit") or traffic.get("max") or traffic.get("quota")
-            if isinstance(used, (int, float)) and isinstance(limit, (int, float)):
+        for container_key, used_keys, limit_keys in _USAGE_PATHS:
+            traffic = data.get(container_key)
+            if type(traffic) is not dict:
+                continue
+            used  = next((traffic[k] for k in used_keys if k in traffic), None)
+            limit = next((traffic[k] for k in limit_keys if k in traffic), None)
+            if type(used) in _NUM_TYPES and type(limit) in _NUM_TYPES:
+                return int(used), int(limit)
+        for used_key, limit_key in _FLAT_PAIRS:
+            used  = data.get(used_key)
+            limit = data.get(limit_key)
+            if type(used) in _NUM_TYPES and type(limit) in _NUM_TYPES:
                 return int(used), int(limit)
-        used  = data.get("trafficUsed") or data.get("monthlyTrafficUsed")
-        limit = data.get("trafficLimit") or data.get("monthlyTrafficLimit")
-        if isinstance(used, (int, float)) and isinstance(limit, (int, float)):
-            return int(used), int(limit)
         return None, None
 
-    async def is_quota_exhausted(self, threshold: float = 0.995) -> Optional[bool]:
-        info = await self.get_account_info()
-        if not info:
-            return None
-        used, limit = self._extract_usage(info)
+    async def is_quota_exhausted(self, threshold: float = 0.995, ttl: float = 30.0) -> Optional[bool]:
+        if self._usage_cache and (time.monotonic() - self._usage_cache[0]) < ttl:
+            _, used, limit = self._usage_cache
+        else:
+            info = await self.get_account_info()
+            if not info:
+                return None
+            used, limit = self._extract_usage(info)
+            self._usage_cache = (time.monotonic(), used, limit)
         if used is None or limit is None or limit == 0:
             return None
         return (used / limit) >= threshold
@@ -106,12 +290,12 @@ class GofileClient:
     # ----- upload helpers -----
 
     @staticmethod
-    def _normalize_response(resp_status: int, raw_text: str, fallback_name: str) -> Dict[str, Any]:
+    def _normalize_response(resp_status: int, raw_body: bytes, fallback_name: str) -> Dict[str, Any]:
         """Return a predictable dict with downloadPage/contentId/fileName/error/httpStatus/raw."""
         try:
-            j = json.loads(raw_text)
+            j = orjson.loads(raw_body)  # decodes UTF-8 internally, no str round-trip
         except Exception:
-            j = {"status": "unknown", "raw": raw_text}
+            j = {"status": "unknown", "raw": raw_body.decode("utf-8", "replace")}
 
         data = j.get("data") or j
 
@@ -141,54 +325,121 @@ class GofileClient:
         return normalized
 
     async def _upload_once(
-        self, file_path: str, folder_id: Optional[str], progress_status, as_guest: bool
+        self, file_path: str, folder_id: Optional[str], progress_status, as_guest: bool,
+        known_size: Optional[int] = None,
     ) -> Dict[str, Any]:
         params: Dict[str, Any] = {}
         if folder_id and not as_guest:
             params["folderId"] = folder_id  # folderId needs auth
 
-        file_size = os.path.getsize(file_path)
+        # Callers usually already know the size (Telegram reports it);
+        # only stat as a fallback, and off-loop so it can't block the event loop
+        file_size = known_size if known_size is not None else await asyncio.to_thread(os.path.getsize, file_path)
         disp_name = os.path.basename(file_path)  # ← keep EXACT same name the user has
 
-        # live progress (cap at 99.9% until server responds)
-        last = {"t": time.time(), "sent": 0}
-        def on_chunk(n: int):
-            last["sent"] += n
-            if not progress_status:
-                return
-            now = time.time()
-            if now - last["t"] >= 1:
+        # live progress: on_chunk bumps a counter and flags the event; one
+        # long-lived task wakes on the flag and issues a single edit at a time
+        prog = _UploadProgress(progress_status, file_size)
+        on_chunk = prog.on_chunk
+
+        # Both branches below yield a fully sized multipart body, so aiohttp
+        # sends Content-Length (no chunked framing) — same effect as FormData
+        # over a plain file object, but without giving up the async prefetch
+        part_headers = {"Content-Disposition": f'form-data; name="file"; filename="{disp_name}"'}
+        small_body = None
+        if file_size <= UPLOAD_CHUNK_SIZE:
+            # Common small-file case: one off-loop read, no queue/thread pipeline
+            small_body = await asyncio.to_thread(_read_whole, file_path)
+
+        def _build_body() -> MultipartWriter:
+            mp = MultipartWriter("form-data")
+            if small_body is not None:
+                mp.append(_CountedBytesPayload(small_body, on_chunk), part_headers)
+            else:
+                mp.append(
+                    _SizedAsyncIterablePayload(
+                        _iter_file(file_path, UPLOAD_CHUNK_SIZE, on_chunk, depth=_prefetch_depth(file_size)),
+                        size=file_size,
+                    ),
+                    part_headers,
+                )
+            return mp
+
+        updater = asyncio.create_task(prog.run()) if progress_status else None
+        try:
+            # Retry transient connection errors, but only while nothing has
+            # been sent — once bytes are on the wire, redoing a multi-GB body
+            # belongs to the caller's account-rotation loop, not here
+            for attempt in range(3):
+                prog.sent = 0
                 try:
-                    pct = (last["sent"] / file_size * 100) if file_size else 0.0
-                    pct = min(pct, 99.9)
-                    asyncio.create_task(progress_status.edit(f"⬆️ Uploading… {pct:.1f}%"))
-                except Exception:
-                    pass
-                last["t"] = now
+                    async with self.session.post(
+                        UPLOAD_URL, data=_build_body(), params=params,
+                        headers=self._auth_headers(as_guest=as_guest),
+                    ) as resp:
+                        if updater:
+                            # Signal terminal state and let the progress task
+                            # flush its own final "100%" edit before we go on
+                            prog.finish()
+                            await updater
+                            updater = None
+                        raw = await resp.read()
+                        return self._normalize_response(resp.status, raw, disp_name)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt == 2 or prog.sent > 0:
+                        raise
+                    await asyncio.sleep(2 ** attempt)
+        finally:
+            if updater:
+                updater.cancel()
+
+    async def upload_stream(
+        self, stream, *, name: str, size: int, folder_id: Optional[str] = None,
+        progress_status=None,
+    ) -> Dict[str, Any]:
+        """Upload from a live async byte stream whose total size is known.
+
+        Single attempt, token only: the stream can be consumed exactly once,
+        so there is no guest retry here — callers fall back to the staged
+        file via upload_file when this fails.
+        """
+        params: Dict[str, Any] = {}
+        if folder_id:
+            params["folderId"] = folder_id
+
+        prog = _UploadProgress(progress_status, size)
 
+        async def _counted():
+            async for chunk in stream:
+                prog.on_chunk(len(chunk))
+                yield chunk
+
+        part_headers = {"Content-Disposition": f'form-data; name="file"; filename="{name}"'}
         mp = MultipartWriter("form-data")
-        mp.append(
-            payload.AsyncIterablePayload(_iter_file(file_path, 4 * 1024 * 1024, on_chunk)),
-            {"Content-Disposition": f'form-data; name="file"; filename="{disp_name}"'},
-        )
+        mp.append(_SizedAsyncIterablePayload(_counted(), size=size), part_headers)
 
-        async with self.session.post(
-            UPLOAD_URL, data=mp, params=params, headers=self._auth_headers(as_guest=as_guest)
-        ) as resp:
-            if progress_status:
-                try:
-                    await progress_status.edit("⬆️ Uploading… 100% (processing…)")
-                except Exception:
-                    pass
-            text = await resp.text()
-            return self._normalize_response(resp.status, text, disp_name)
+        updater = asyncio.create_task(prog.run()) if progress_status else None
+        try:
+            async with self.session.post(
+                UPLOAD_URL, data=mp, params=params, headers=self._auth_headers(as_guest=False)
+            ) as resp:
+                if updater:
+                    prog.finish()
+                    await updater
+                    updater = None
+                raw = await resp.read()
+                return self._normalize_response(resp.status, raw, name)
+        finally:
+            if updater:
+                updater.cancel()
 
     async def upload_file(
-        self, file_path: str, folder_id: Optional[str] = None, progress_status=None
+        self, file_path: str, folder_id: Optional[str] = None, progress_status=None,
+        known_size: Optional[int] = None,
     ) -> Dict[str, Any]:
         # Try with Bearer token first
-        first = await self._upload_once(file_path, folder_id, progress_status, as_guest=False)
+        first = await self._upload_once(file_path, folder_id, progress_status, as_guest=False, known_size=known_size)
         # If auth fails, retry once as guest
         if first.get("error") and first.get("httpStatus") in (401, 403):
-            return await self._upload_once(file_path, None, progress_status, as_guest=True)
+            return await self._upload_once(file_path, None, progress_status, as_guest=True, known_size=known_size)
         return first
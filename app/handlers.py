@@ -5,7 +5,10 @@ import logging
 import os
 import time
 import mimetypes
+import random
 import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from html import escape
 from telegram.constants import ParseMode
@@ -15,60 +18,102 @@ from telegram.ext import ContextTypes
 from pyrogram.errors import RPCError
 
 from . import messages as M
-from .pyro_client import get_client
-from .netutils import smart_download, pick_filename_for_url, sanitize_filename
+from .pyro_client import get_client, reset_client
+from .netutils import smart_download, pick_filename_for_url, sanitize_filename, _StreamTee
 from .config import DOWNLOAD_DIR, BOT_API_BASE_URL, TELEGRAM_BOT_TOKEN
 from .account_pool import AccountPool
 from .gofile_api import GofileClient
 
 log = logging.getLogger(__name__)
 
+# Tiny dedicated pool so cleanup never blocks the event loop or competes
+# with asyncio.to_thread users of the default executor
+_CLEANUP_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="unlink")
+
+# The staging directory never moves during the process lifetime — create it
+# once here instead of stat()ing it on every incoming request
+os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+
+def _discard_file(path: str) -> None:
+    """Fire-and-forget unlink, off the event loop."""
+    def _unlink():
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            log.warning("Could not remove %s", path, exc_info=True)
+    asyncio.get_running_loop().run_in_executor(_CLEANUP_EXECUTOR, _unlink)
+
 _URL_RE = re.compile(r'(https?://\S+)', re.I)
+_SANITIZE_RE = re.compile(r"[^\w.\-()+\[\]{} ]+")
 
-def _extract_urls(text: str | None) -> list[str]:
-    if not text:
-        return []
-    return _URL_RE.findall(text.strip())
+def _extract_urls(*parts: str | None) -> list[str]:
+    # One scan over text+caption joined, instead of two findall passes and a
+    # list concatenation; the regex itself can't backtrack (\S+ is greedy-only)
+    buf = "\n".join(p for p in parts if p)
+    return _URL_RE.findall(buf) if buf else []
 
 class _ThrottleEdit:
+    # edit() runs on every progress tick — slot storage keeps the five
+    # attribute accesses off the instance-dict path
+    __slots__ = ("msg", "interval", "_last", "_last_text", "_cooldown_until")
+
     def __init__(self, msg, interval: float = 1.0):
         self.msg = msg
         self.interval = interval
         self._last = 0.0
+        self._last_text = ""
+        self._cooldown_until = 0.0
 
     async def edit(self, text: str, force: bool = False):
-        now = time.time()
-        if force or now - self._last >= self.interval:
-            self._last = now
-            try:
-                await self.msg.edit_text(
-                    text,
-                    parse_mode=ParseMode.HTML,
-                    link_preview_options=LinkPreviewOptions(is_disabled=True),
-                )
-            except Exception:
-                # We don't want a failed UI edit to crash the flow
-                pass
+        now = time.monotonic()
+        if text == self._last_text:
+            return  # Telegram would reject it as "not modified" anyway
+        if not force and (now - self._last < self.interval or now < self._cooldown_until):
+            return
+        self._last = now
+        try:
+            await self.msg.edit_text(
+                text,
+                parse_mode=ParseMode.HTML,
+                link_preview_options=LinkPreviewOptions(is_disabled=True),
+            )
+            self._last_text = text
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                self._last_text = text  # server already shows this text
+            else:
+                self._cooldown_until = now + 10.0
+        except Exception:
+            # A failed UI edit must not crash the flow; back off so a flaky
+            # connection or 429 doesn't raise once per tick
+            self._cooldown_until = now + 10.0
 
 # --- progress helpers for HTTP downloads ---
+# Hot-path constants: these run on every progress tick, so no repeated
+# 1024**2 arithmetic and no string building for the bar — all 19 possible
+# bars (width 18) are prebuilt once
+_KiB = 1024
+_MiB = 1048576
+_BAR_WIDTH = 18
+_BARS = tuple("█" * i + "░" * (_BAR_WIDTH - i) for i in range(_BAR_WIDTH + 1))
+
 def _fmt_bytes(n: int) -> str:
     try:
-        return f"{n / (1024 * 1024):.1f} MB"
+        return f"{n / _MiB:.1f} MB"
     except Exception:
         return f"{n} B"
 
-def _progress_bar(p: float, width: int = 18) -> str:
-    p = max(0.0, min(1.0, p))
-    filled = int(p * width)
-    return "█" * filled + "░" * (width - filled)
+def _progress_bar(p: float, width: int = _BAR_WIDTH) -> str:
+    return _BARS[int(max(0.0, min(1.0, p)) * width)]
 
 def _make_progress_cb(status_msg: "_ThrottleEdit"):
-    import time
     last_edit = 0.0
 
     async def cb(total: int | None, downloaded: int):
         nonlocal last_edit
-        now = time.time()
+        now = time.monotonic()
         # throttle UI to ~1 update/sec (download can be very chatty)
         if now - last_edit < 1.0 and downloaded:
             return
@@ -88,40 +133,62 @@ def _make_progress_cb(status_msg: "_ThrottleEdit"):
     return cb
 
 def _fmt_speed(bytes_per_sec: float) -> str:
-    if bytes_per_sec >= 1024**2:
-        return f"{bytes_per_sec/1024**2:.2f} MB/s"
-    if bytes_per_sec >= 1024:
-        return f"{bytes_per_sec/1024:.2f} KB/s"
+    if bytes_per_sec >= _MiB:
+        return f"{bytes_per_sec/_MiB:.2f} MB/s"
+    if bytes_per_sec >= _KiB:
+        return f"{bytes_per_sec/_KiB:.2f} KB/s"
     return f"{bytes_per_sec:.0f} B/s"
 
-def _ptb_progress_factory(status: _ThrottleEdit, start_time: float, loop):
-    def _cb(current: int, total: int, *args):
+class _ProgressState:
+    """Latest-value slot the chunk callbacks write into.
+
+    Callbacks (which may run on library threads) do nothing but plain
+    attribute writes — atomic under the GIL, no locking, no per-chunk task
+    or string building. One _progress_updater task per transfer reads the
+    slot on its own clock and issues the edits.
+    """
+
+    __slots__ = ("current", "total", "start_time", "kind")
+
+    def __init__(self, start_time: float, kind: str):
+        self.current = 0
+        self.total = 0
+        self.start_time = start_time
+        self.kind = kind
+
+async def _progress_updater(status: _ThrottleEdit, state: _ProgressState, interval: float = 1.0):
+    last = -1
+    while True:
+        await asyncio.sleep(interval)
+        current = state.current
+        if current == last:
+            continue  # nothing moved — skip the format + edit entirely
+        last = current
+        total = state.total
         pct = (current / total * 100) if total else 0.0
-        elapsed = max(0.001, time.time() - start_time)
-        spd = current / elapsed
+        elapsed = max(0.001, time.monotonic() - state.start_time)
         progress = M.progress_block(
             pct=pct,
-            current_mb=current / 1024 / 1024,
-            total_mb=(total / 1024 / 1024) if total else None,
-            speed_human=_fmt_speed(spd),
+            current_mb=current / _MiB,
+            total_mb=(total / _MiB) if total else None,
+            speed_human=_fmt_speed(current / elapsed),
         )
-        text = M.downloading_via_botapi(progress)
-        loop.call_soon_threadsafe(asyncio.create_task, status.edit(text))
+        if state.kind == "botapi":
+            text = M.downloading_via_botapi(progress)
+        else:
+            text = M.downloading_via_mtproto(progress)
+        await status.edit(text)
+
+def _ptb_progress_factory(state: _ProgressState):
+    def _cb(current: int, total: int, *args):
+        state.current = current
+        state.total = total
     return _cb
 
-def _pyro_progress_factory(status: _ThrottleEdit, start_time: float, loop):
+def _pyro_progress_factory(state: _ProgressState):
     def _cb(current: int, total: int):
-        pct = (current / total * 100) if total else 0.0
-        elapsed = max(0.001, time.time() - start_time)
-        spd = current / elapsed
-        progress = M.progress_block(
-            pct=pct,
-            current_mb=current / 1024 / 1024,
-            total_mb=(total / 1024 / 1024) if total else None,
-            speed_human=_fmt_speed(spd),
-        )
-        text = M.downloading_via_mtproto(progress)
-        loop.call_soon_threadsafe(asyncio.create_task, status.edit(text))
+        state.current = current
+        state.total = total
     return _cb
 
 async def _download_telegram_file(update: Update, context: ContextTypes.DEFAULT_TYPE, status: _ThrottleEdit) -> str | None:
@@ -145,7 +212,6 @@ async def _download_telegram_file(update: Update, context: ContextTypes.DEFAULT_
     else:
         return None
 
-    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
     dest = os.path.join(DOWNLOAD_DIR, filename)
 
     base = (BOT_API_BASE_URL or "https://api.telegram.org").rstrip("/")
@@ -174,8 +240,29 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     limit_gb = (limit / gb) if (limit is not None) else None
     await update.message.reply_text(M.stats_header(idx, acc_id, used_gb, limit_gb))
 
+# Public Bot API refuses getFile beyond this — not worth the round-trip
+_BOT_API_FILE_LIMIT = 20 * 1024 * 1024
+
+def _public_bot_api() -> bool:
+    return not BOT_API_BASE_URL or "api.telegram.org" in BOT_API_BASE_URL
+
+def _msg_file_size(msg) -> int | None:
+    """Size Telegram already reported for the attached media, if any."""
+    for attr in ("document", "video", "audio"):
+        media = getattr(msg, attr, None)
+        if media and getattr(media, "file_size", None):
+            return media.file_size
+    if msg.photo:
+        return msg.photo[-1].file_size
+    return None
+
+# Media slots probed for a filename, in preference order — built once, not
+# per message
+_MEDIA_ATTRS = ("document", "video", "audio", "voice", "photo", "animation", "video_note")
+
 def _guess_filename_from_msg(m) -> str:
-    for attr in ("document", "video", "audio", "voice", "photo", "animation", "video_note"):
+    # getattr (not m.__dict__.get): pyrogram types may use slots/properties
+    for attr in _MEDIA_ATTRS:
         media = getattr(m, attr, None)
         if not media:
             continue
@@ -191,25 +278,34 @@ def _guess_filename_from_msg(m) -> str:
     return f"{m.id}{ext or '.bin'}"
 
 async def _download_via_pyrogram(update: Update, dest_dir: str, status: _ThrottleEdit) -> str | None:
-    os.makedirs(dest_dir, exist_ok=True)
     chat_id = update.effective_chat.id
     msg_id = update.effective_message.message_id
-    client = await get_client()
-    m = await client.get_messages(chat_id, msg_id)
+    try:
+        client = await get_client()
+        m = await client.get_messages(chat_id, msg_id)
+    except (ConnectionError, RPCError):
+        # Stale or dead MTProto session — rebuild once, then let the error
+        # propagate to the caller's RPCError handling as before
+        await reset_client()
+        client = await get_client()
+        m = await client.get_messages(chat_id, msg_id)
 
     filename = _guess_filename_from_msg(m)
-    filename = re.sub(r"[^\w.\-()+\[\]{} ]+", "_", filename).strip(" .")
+    filename = _SANITIZE_RE.sub("_", filename).strip(" .")
     if not filename:
         filename = f"{m.id}.bin"
 
     full_path = str(Path(dest_dir) / filename)
-    start = time.time()
-    loop = asyncio.get_running_loop()
-    return await m.download(
-        file_name=full_path,
-        progress=_pyro_progress_factory(status, start, loop),
-        progress_args=()
-    )
+    state = _ProgressState(time.monotonic(), "mtproto")
+    updater = asyncio.create_task(_progress_updater(status, state))
+    try:
+        return await m.download(
+            file_name=full_path,
+            progress=_pyro_progress_factory(state),
+            progress_args=()
+        )
+    finally:
+        updater.cancel()
 
 def _extract_gofile_result(result: dict) -> tuple[str | None, str | None]:
     """
@@ -245,71 +341,161 @@ def _extract_gofile_result(result: dict) -> tuple[str | None, str | None]:
     )
     return link, cid
 
+async def _announce_success(status: _ThrottleEdit, pool: AccountPool, idx: int, path: str, result: dict, size_hint: int | None = None) -> bool:
+    """Report a finished upload to the user; False when result held no link."""
+    dl, content_id = _extract_gofile_result(result)
+    if not dl:
+        return False
+    # Paths are built via os.path.join above, so a plain rpartition beats the
+    # normalization walk in os.path.basename
+    filename = path.rpartition(os.sep)[2]
+    if size_hint:
+        size_bytes = size_hint  # caller already knows — skip the stat()
+    else:
+        try:
+            size_bytes = os.stat(path).st_size
+        except OSError:
+            size_bytes = 0
+    pool.record_bytes(idx, size_bytes)
+    # One emission per upload: build the final text in a local, then a single
+    # forced edit (bypasses the throttle window, still deduplicated)
+    text = M.upload_success(filename, size_bytes / _MiB, dl)
+    if content_id:
+        text += f"\n• <b>Content ID:</b> <code>{escape(str(content_id))}</code>"
+    await status.edit(text, force=True)
+    return True
+
+# HTTP statuses worth retrying on the same account before rotating
+_TRANSIENT_HTTP = {429, 500, 502, 503, 504}
+
+async def _upload_with_retry(c: GofileClient, path: str, status: _ThrottleEdit, known_size: int | None = None) -> dict:
+    """Up to three attempts against one account for transient server errors.
+
+    Jittered exponential backoff between attempts; quota/auth failures and
+    successes return immediately so rotation logic stays with the caller.
+    A brief 503 no longer retires an otherwise-healthy token."""
+    result: dict = {}
+    for attempt in range(3):
+        result = await c.upload_file(path, progress_status=status, known_size=known_size)
+        if not (isinstance(result, dict) and result.get("error")):
+            return result
+        if result.get("httpStatus") not in _TRANSIENT_HTTP:
+            return result
+        if attempt < 2:
+            await asyncio.sleep(min(2.0, (2 ** attempt) * 0.1 + random.random() * 0.1))
+    return result
+
 async def _process_http_url(url: str, update: Update, context: ContextTypes.DEFAULT_TYPE):
-    sem = context.bot_data["sem"]
-    async with sem:
-        status_msg = await update.effective_message.reply_text(M.url_start(url))
-        status = _ThrottleEdit(status_msg, interval=1.0)
-        path = None
+    status_msg = await update.effective_message.reply_text(M.url_start(url))
+    status = _ThrottleEdit(status_msg, interval=1.0)
+    pool: AccountPool = context.bot_data["pool"]
+    path = None
+    dl_task = None
+    try:
+        await status.edit(M.url_downloading())
+        fname = pick_filename_for_url(url, fallback="download.bin")  # << no await; correct kw
+        path = os.path.join(DOWNLOAD_DIR, fname)
+
+        # Tee the download: bytes land on disk (so retries never re-download)
+        # and, when the total size is known up front, simultaneously feed a
+        # Gofile upload — network-in and network-out overlap instead of
+        # running back to back.
+        dl_cb = _make_progress_cb(status)                            # << progress for HTTP
+        upload_live = False
+
+        async def progress_cb(total, downloaded):
+            if not upload_live:  # upload percent takes over once streaming
+                await dl_cb(total, downloaded)
+
+        tee = _StreamTee()
+        dl_task = asyncio.create_task(smart_download(url, path, progress=progress_cb, sink=tee))
+        dl_task.add_done_callback(
+            lambda t: tee.reset() if (t.cancelled() or t.exception()) else None
+        )
+
+        uploaded = None  # (idx, result) once a streamed upload went through
+        total = await tee.size
+        if total > 0:
+            idx, client = await pool.pick()
+            log.info("Using token index %s for upload (URL, streamed)", idx)
+            upload_live = True
+            await status.edit(M.upload_start())
+            try:
+                async with client as c:
+                    result = await c.upload_stream(
+                        tee.stream(), name=fname, size=total, progress_status=status
+                    )
+                if _extract_gofile_result(result)[0]:
+                    uploaded = (idx, result)
+            except Exception:
+                log.info("Streamed upload failed; falling back to staged file", exc_info=True)
+            if uploaded is None:
+                tee.reset()  # unblock the producer; the staged copy finishes
+                upload_live = False
+
         try:
-            # progress-visible HTTP download
-            await status.edit(M.url_downloading())
-            fname = pick_filename_for_url(url, fallback="download.bin")  # << no await; correct kw
-            os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-            path = os.path.join(DOWNLOAD_DIR, fname)
-            progress_cb = _make_progress_cb(status)                      # << progress for HTTP
-            await smart_download(url, path, progress=progress_cb)
+            await dl_task  # surface download errors; staged file is complete
         except Exception as e:
             await status.edit(M.error("URL download", f"{type(e).__name__}: {e}"), force=True)
             return
 
-        pool: AccountPool = context.bot_data["pool"]
-        try:
-            await status.edit(M.upload_start())
-            for _ in range(len(pool.tokens)):
-                idx, client = await pool.pick()
-                log.info("Using token index %s for upload (URL)", idx)
-                try:
-                    async with client as c:
-                        result = await c.upload_file(path, progress_status=status)
-                except Exception as e:
-                    await status.edit(M.error("Upload", f"{type(e).__name__}: {e}"), force=True)
-                    return
+        if uploaded is not None:
+            idx, result = uploaded
+            await _announce_success(status, pool, idx, path, result, size_hint=total)
+            return
 
-                dl, content_id = _extract_gofile_result(result)
-                if dl:
-                    filename = os.path.basename(path)
-                    try:
-                        size_mb = os.path.getsize(path) / (1024**2)
-                    except Exception:
-                        size_mb = 0.0
-                    await status.edit(
-                        M.upload_success(filename, size_mb, dl)
-                        + (f"\n• <b>Content ID:</b> <code>{escape(str(content_id))}</code>" if content_id else ""),
-                        force=True,
-                    )
-                    break
-                else:
-                    if isinstance(result, dict) and result.get("error"):
-                        await status.edit(M.error("Upload", f"HTTP {result.get('httpStatus')} | {escape(str(result.get('raw'))[:600])}"), force=True)
-                        return
-                    await pool.mark_exhausted(idx)
-            else:
-                await status.edit(M.all_exhausted(), force=True)
-        finally:
+        await status.edit(M.upload_start())
+        done = False
+        for _ in range(len(pool.tokens)):
+            # pick_healthy skips known-exhausted accounts outright — no TLS
+            # handshake and no doomed upload attempt per bad token
+            picked = await pool.pick_healthy()
+            if picked is None:
+                break
+            idx, client = picked
+            log.info("Using token index %s for upload (URL)", idx)
             try:
-                if path:
-                    os.remove(path)
-            except Exception:
-                pass
+                async with client as c:
+                    result = await _upload_with_retry(c, path, status)
+            except Exception as e:
+                await status.edit(M.error("Upload", f"{type(e).__name__}: {e}"), force=True)
+                return
+
+            if await _announce_success(status, pool, idx, path, result):
+                done = True
+                break
+            if isinstance(result, dict) and result.get("error"):
+                if result.get("httpStatus") in (401, 403):
+                    # auth/quota problem with this token — bench it, try next
+                    await pool.mark_exhausted(idx)
+                    continue
+                await status.edit(M.error("Upload", f"HTTP {result.get('httpStatus')} | {escape(str(result.get('raw'))[:600])}"), force=True)
+                return
+            await pool.mark_exhausted(idx)
+        if not done:
+            await status.edit(M.all_exhausted(), force=True)
+    finally:
+        if dl_task is not None and not dl_task.done():
+            dl_task.cancel()
+        if path:
+            _discard_file(path)
 
 async def _process_telegram_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    sem = context.bot_data["sem"]
-    async with sem:
-        status_msg = await update.effective_message.reply_text("⏳ <b>Starting…</b>")
-        status = _ThrottleEdit(status_msg, interval=1.0)
+    status_msg = await update.effective_message.reply_text("⏳ <b>Starting…</b>")
+    status = _ThrottleEdit(status_msg, interval=1.0)
+
+    known_size = _msg_file_size(update.effective_message)
 
-        path = None
+    path = None
+    if known_size and known_size > _BOT_API_FILE_LIMIT and _public_bot_api():
+        # getFile would be a guaranteed "File is too big" + retry — go
+        # straight to MTProto and save the round-trip
+        try:
+            path = await _download_via_pyrogram(update, DOWNLOAD_DIR, status)
+        except RPCError as e2:
+            await status.edit(M.error("Download via MTProto", str(e2)), force=True)
+            return
+    else:
         try:
             path = await _download_telegram_file(update, context, status)
         except BadRequest as e:
@@ -323,62 +509,105 @@ async def _process_telegram_media(update: Update, context: ContextTypes.DEFAULT_
                 await status.edit(M.error("Download", str(e)), force=True)
                 return
 
-        if not path:
+    if not path:
+        try:
+            path = await _download_via_pyrogram(update, DOWNLOAD_DIR, status)
+        except Exception:
+            await status.edit(M.no_file_found(), force=True)
+            return
+
+    pool: AccountPool = context.bot_data["pool"]
+    try:
+        await status.edit(M.upload_start())
+        done = False
+        for _ in range(len(pool.tokens)):
+            picked = await pool.pick_healthy()
+            if picked is None:
+                break
+            idx, client = picked
+            log.info("Using token index %s for upload (TG)", idx)
             try:
-                path = await _download_via_pyrogram(update, DOWNLOAD_DIR, status)
-            except Exception:
-                await status.edit(M.no_file_found(), force=True)
+                async with client as c:
+                    result = await _upload_with_retry(c, path, status, known_size=known_size)
+            except Exception as e:
+                await status.edit(M.error("Upload", f"{type(e).__name__}: {e}"), force=True)
                 return
 
-        pool: AccountPool = context.bot_data["pool"]
-        try:
-            await status.edit(M.upload_start())
-            for _ in range(len(pool.tokens)):
-                idx, client = await pool.pick()
-                log.info("Using token index %s for upload (TG)", idx)
-                try:
-                    async with client as c:
-                        result = await c.upload_file(path, progress_status=status)
-                except Exception as e:
-                    await status.edit(M.error("Upload", f"{type(e).__name__}: {e}"), force=True)
-                    return
-
-                dl, content_id = _extract_gofile_result(result)
-                if dl:
-                    filename = os.path.basename(path)
-                    try:
-                        size_mb = os.path.getsize(path) / (1024**2)
-                    except Exception:
-                        size_mb = 0.0
-                    await status.edit(
-                        M.upload_success(filename, size_mb, dl)
-                        + (f"\n• <b>Content ID:</b> <code>{escape(str(content_id))}</code>" if content_id else ""),
-                        force=True,
-                    )
-                    break
-                else:
-                    if isinstance(result, dict) and result.get("error"):
-                        await status.edit(M.error("Upload", f"HTTP {result.get('httpStatus')} | {escape(str(result.get('raw'))[:600])}"), force=True)
-                        return
+            if await _announce_success(status, pool, idx, path, result):
+                done = True
+                break
+            if isinstance(result, dict) and result.get("error"):
+                if result.get("httpStatus") in (401, 403):
+                    # auth/quota problem with this token — bench it, try next
                     await pool.mark_exhausted(idx)
-            else:
-                await status.edit(M.all_exhausted(), force=True)
-
-        finally:
+                    continue
+                await status.edit(M.error("Upload", f"HTTP {result.get('httpStatus')} | {escape(str(result.get('raw'))[:600])}"), force=True)
+                return
+            await pool.mark_exhausted(idx)
+        if not done:
+            await status.edit(M.all_exhausted(), force=True)
+
+    finally:
+        if path:
+            _discard_file(path)
+
+# How many worker slots a single chat may occupy at once; anything beyond
+# that waits in the chat's own backlog instead of the shared queue
+_PER_CHAT_JOBS = 2
+
+async def _chat_job(context: ContextTypes.DEFAULT_TYPE, chat_id: int, coro) -> None:
+    """Run one admitted job, then drain the chat's backlog through this slot."""
+    active = context.bot_data["chat_active"]
+    backlog = context.bot_data["chat_backlog"]
+    try:
+        while True:
             try:
-                if path:
-                    os.remove(path)
+                await coro
             except Exception:
-                pass
+                log.exception("Transfer job failed (chat %s)", chat_id)
+            pending = backlog.get(chat_id)
+            if not pending:
+                break
+            coro = pending.popleft()
+            if not pending:
+                del backlog[chat_id]
+    finally:
+        n = active.get(chat_id, 0) - 1
+        if n > 0:
+            active[chat_id] = n
+        else:
+            active.pop(chat_id, None)  # idle chats leave nothing behind
+
+async def _submit_job(context: ContextTypes.DEFAULT_TYPE, coro, chat_id: int | None = None) -> None:
+    """Hand a transfer coroutine to the worker pool (fall back to a bare task).
+
+    With a chat_id, admission is two-level: each chat gets at most
+    _PER_CHAT_JOBS slots in the shared queue and its overflow queues up
+    privately, so one user pasting dozens of URLs cannot monopolise the
+    workers while other chats wait."""
+    queue = context.bot_data.get("jobs")
+    if queue is None:
+        asyncio.create_task(coro)
+        return
+    if chat_id is None:
+        await queue.put(coro)  # bounded → backpressure when the backlog grows
+        return
+    active = context.bot_data.setdefault("chat_active", {})
+    backlog = context.bot_data.setdefault("chat_backlog", {})
+    if active.get(chat_id, 0) >= _PER_CHAT_JOBS:
+        backlog.setdefault(chat_id, deque()).append(coro)
+        return
+    active[chat_id] = active.get(chat_id, 0) + 1
+    await queue.put(_chat_job(context, chat_id, coro))
 
 async def handle_incoming_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg = update.effective_message
-    urls = _extract_urls((msg.text or "")) + _extract_urls((msg.caption or ""))
+    urls = _extract_urls(msg.text, msg.caption)
 
     if urls:
         for url in urls:
-            asyncio.create_task(_process_http_url(url, update, context))
+            await _submit_job(context, _process_http_url(url, update, context), chat_id=msg.chat_id)
         await msg.reply_text(M.queue_ack(len(urls)))
         return
 
-    asyncio.create_task(_process_telegram_media(update, context))
+    await _submit_job(context, _process_telegram_media(update, context), chat_id=msg.chat_id)
@@ -0,0 +1,50 @@
+# app/http_clients.py
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+import httpx
+
+# One process-wide pool: TLS + HTTP/2 setup is paid once per origin instead
+# of once per download, and keep-alive connections survive between the URLs
+# of a queued batch. pool=None because a long backlog waiting on the same
+# origin must not die with a spurious PoolTimeout.
+_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=15.0)
+_TIMEOUT = httpx.Timeout(connect=60.0, read=900.0, write=300.0, pool=None)
+
+_client: Optional[httpx.AsyncClient] = None
+_download_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Shared client for probes and metadata — HTTP/2 multiplexes many small
+    requests over one connection cheaply."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(http2=True, limits=_LIMITS, timeout=_TIMEOUT)
+    return _client
+
+
+def get_download_client() -> httpx.AsyncClient:
+    """Shared client for bulk body streams.
+
+    HTTP/1.1 by default: concurrent transfers then ride separate TCP sockets
+    instead of multiplexing one connection, avoiding head-of-line blocking on
+    packet loss and per-flow congestion caps. Set HTTP2_DOWNLOADS=1 to opt
+    back in.
+    """
+    global _download_client
+    if _download_client is None:
+        h2 = os.getenv("HTTP2_DOWNLOADS", "").strip().lower() in ("1", "true", "yes")
+        _download_client = httpx.AsyncClient(http2=h2, limits=_LIMITS, timeout=_TIMEOUT)
+    return _download_client
+
+
+async def aclose() -> None:
+    """Close and drop the shared clients (call from shutdown hooks)."""
+    global _client, _download_client
+    for c in (_client, _download_client):
+        if c is not None and not c.is_closed:
+            await c.aclose()
+    _client = _download_client = None
@@ -0,0 +1,32 @@
+# app/logsetup.py
+from __future__ import annotations
+
+import logging
+import logging.handlers
+import queue
+
+_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def setup(level_name: str) -> None:
+    """Route all log records through a queue to a background writer thread.
+
+    A plain StreamHandler does a blocking write() on whichever thread logs —
+    including the event-loop thread, stalling every coroutine for the
+    duration of a slow stderr. With a QueueHandler the loop only pays an
+    O(1) enqueue; the QueueListener's own thread does the formatting and the
+    write. Idempotent, so both entrypoints (and their cross-imports) can
+    call it."""
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(_FORMAT))
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, level_name, logging.INFO))
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(q))
+    _listener = logging.handlers.QueueListener(q, handler, respect_handler_level=True)
+    _listener.start()
@@ -1,8 +1,14 @@
 # app/messages.py
 from __future__ import annotations
+from functools import lru_cache
 from html import escape
 from typing import Any
 
+# Status edits re-escape the same URL/filename/account-id strings over and
+# over during one transfer; memoise the hot call sites (escape stays direct
+# for one-shot strings)
+_esc = lru_cache(maxsize=512)(escape)
+
 def start() -> str:
     return (
         "<b>👋 Welcome to GoFile Uploader Bot</b>\n\n"
@@ -34,7 +40,7 @@ def queue_ack(n: int) -> str:
     return f"⌛ Queued <b>{n}</b> URL(s) for processing…"
 
 def url_start(url: str) -> str:
-    return f"🔗 <b>URL received</b>\n<code>{escape(url)}</code>"
+    return f"🔗 <b>URL received</b>\n<code>{_esc(url)}</code>"
 
 def downloading_via_botapi(progress: str | None = None) -> str:
     base = "⬇️ <b>Downloading</b> <i>(Bot API)</i>"
@@ -53,13 +59,13 @@ def upload_start() -> str:
 def upload_success(filename: str, size_mb: float, link: str) -> str:
     return (
         "✅ <b>Uploaded to GoFile</b>\n"
-        f"• <b>File:</b> <code>{escape(filename)}</code>\n"
+        f"• <b>File:</b> <code>{_esc(filename)}</code>\n"
         f"• <b>Size:</b> {size_mb:.2f} MB\n"
-        f"• <b>Link:</b> <a href=\"{escape(link)}\">{escape(link)}</a>"
+        f"• <b>Link:</b> <a href=\"{_esc(link)}\">{_esc(link)}</a>"
     )
 
 def error(stage: str, detail: str) -> str:
-    return f"❌ <b>{escape(stage)} failed</b>\n<code>{escape(detail)}</code>"
+    return f"❌ <b>{_esc(stage)} failed</b>\n<code>{escape(detail)}</code>"
 
 def all_exhausted() -> str:
     return "❌ <b>No available GoFile accounts</b>\nAll accounts look exhausted or blocked. Try again later."
@@ -67,39 +73,40 @@ def all_exhausted() -> str:
 def no_file_found() -> str:
     return "❌ <b>No file found</b>\nPlease send a media file or a direct URL."
 
+# Preferred id-ish keys when the value is a dict, most common first
+_ID_KEYS = ("id", "accountId", "account_id", "name", "token")
+
 def _to_display_str(val: Any) -> str:
     """Return a stable, short display string for IDs that might be dicts/objects."""
     if val is None:
         return ""
-    try:
-        if isinstance(val, dict):
-            # Prefer common keys if present; else fallback to str(dict)
-            for k in ("id", "accountId", "account_id", "name", "token"):
-                if k in val and val[k]:
-                    return str(val[k])
-        return str(val)
-    except Exception:
-        return ""
+    if isinstance(val, str):
+        return val  # the overwhelmingly common case — no dispatch, no copy
+    if isinstance(val, dict):
+        v = next((val[k] for k in _ID_KEYS if val.get(k)), None)
+        return str(v) if v is not None else str(val)
+    return str(val)
 
 def stats_header(idx: int, account_id: Any, used_gb: float | None, limit_gb: float | None) -> str:
     lines = [f"🧮 <b>Account candidate index:</b> {idx}"]
     acc_str = _to_display_str(account_id)
     if acc_str:
-        lines.append(f"🆔 <b>Account ID:</b> <code>{escape(acc_str)}</code>")
+        lines.append(f"🆔 <b>Account ID:</b> <code>{_esc(acc_str)}</code>")
     if used_gb is not None and limit_gb is not None and limit_gb > 0:
         lines.append(f"📊 <b>Monthly traffic:</b> {used_gb:.2f} / {limit_gb:.2f} GB")
     else:
         lines.append("ℹ️ <i>Usage info is limited for free accounts.</i>")
     return "\n".join(lines)
 
+# All 13 possible 12-char bars, built once — progress_block runs on every
+# throttled edit, so no string-multiply/concat per tick
+_BARS = tuple("█" * i + "░" * (12 - i) for i in range(13))
+
+# One bound str.format instead of re-running BUILD_STRING over five pieces
+_PROG_TMPL = "[{}] {:.1f}%\n{:.2f}/{} MB\nSpeed: {}".format
+
 def progress_block(pct: float, current_mb: float, total_mb: float | None, speed_human: str) -> str:
     # Render a compact progress block you can append to “Downloading …”
     total_part = f"{total_mb:.2f}" if total_mb is not None else "?"
-    # 12-char bar, same as your current logic
-    filled = max(0, min(12, int((pct/100) * 12))) if total_mb else int(pct/100*12)
-    bar = "█"*filled + "░"*(12-filled)
-    return (
-        f"[{bar}] {pct:.1f}%\n"
-        f"{current_mb:.2f}/{total_part} MB\n"
-        f"Speed: {speed_human}"
-    )
+    bar = _BARS[max(0, min(12, int(pct * 0.12)))]
+    return _PROG_TMPL(bar, pct, current_mb, total_part, speed_human)
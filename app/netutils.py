@@ -6,37 +6,54 @@ import re
 import math
 import time
 import random
-from urllib.parse import urlparse, unquote, parse_qs
+from urllib.parse import urlparse, unquote, unquote_plus
 
 import httpx
 
-# ---------- Tunables ----------
-CONNECT_TIMEOUT = 60.0
-READ_TIMEOUT    = 900.0    # long read → full movies won’t truncate at ~2–3 min
-WRITE_TIMEOUT   = 300.0
-POOL_TIMEOUT    = 900.0
+from . import http_clients
 
+# ---------- Tunables ----------
 MAX_RETRIES     = 5
 CHUNK_SIZE      = 1024 * 1024  # 1 MiB per chunk
 
+# Progress callback gate: fire at most once per this many bytes or per second
+PROGRESS_BYTES  = 4 * 1024 * 1024
+
+# Coalesce this many bytes before each disk write — 4x fewer write syscalls
+# than pushing every network chunk through on its own
+WRITE_COALESCE  = 4 * 1024 * 1024
+
 # ---------- Small utils your handlers import ----------
 
+# Path separators + control chars → "_", as a precomputed translate table
+# (single-char substitution via str.translate beats the regex engine here)
+_SANITIZE_TABLE = {ord(c): ord("_") for c in '\\/:*?"<>|'}
+_SANITIZE_TABLE.update({i: ord("_") for i in range(0x20)})
+
+_COLLAPSE_RE = re.compile(r"[\s_]{2,}")
+
 def sanitize_filename(name: str) -> str:
     """Make a safe filesystem name."""
     name = unquote(name).strip()
     # remove path separators and control chars
-    name = re.sub(r"[\\/:*?\"<>|\x00-\x1F]", "_", name)
+    name = name.translate(_SANITIZE_TABLE)
     # collapse spaces/underscores
-    name = re.sub(r"[\s_]{2,}", " ", name).strip()
+    name = _COLLAPSE_RE.sub(" ", name).strip()
     return name or "file.bin"
 
+# Query keys that commonly carry the real filename
+_FN_KEYS = frozenset(("filename", "file", "name", "download", "dl"))
+
 def pick_filename_for_url(url: str, fallback: str = "download.bin") -> str:
     """Heuristically pick a filename from URL path or common query keys."""
     p = urlparse(url)
-    q = parse_qs(p.query)
-    for key in ("filename", "file", "name", "download", "dl"):
-        if key in q and q[key]:
-            return sanitize_filename(q[key][0])
+    if p.query:
+        # Hand scan instead of parse_qs: no dict-of-lists build and no
+        # decoding of values we never look at
+        for pair in p.query.split("&"):
+            k, _, v = pair.partition("=")
+            if k in _FN_KEYS and v:
+                return sanitize_filename(unquote_plus(v))
     path = unquote(p.path.rstrip("/"))
     if path:
         base = os.path.basename(path)
@@ -44,6 +61,73 @@ def pick_filename_for_url(url: str, fallback: str = "download.bin") -> str:
             return sanitize_filename(base)
     return sanitize_filename(fallback)
 
+# ---------- Stream tee ----------
+
+_TEE_RESET = object()
+
+class _StreamTee:
+    """Mirror of a download in flight, for overlapping the upload.
+
+    smart_download feeds each chunk here *as well as* writing it to disk; a
+    consumer iterates stream() to push the same bytes to Gofile while the
+    file is still being written. The moment continuity can't be guaranteed
+    (resume from a pre-existing file, server ignoring Range, download error)
+    the tee is reset: the consumer gets an error and falls back to the fully
+    staged file, which keeps downloading regardless.
+    """
+
+    __slots__ = ("_queue", "size", "fed", "broken")
+
+    def __init__(self, depth: int = 8):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+        # Resolves to the total download size, or -1 when streaming is off
+        self.size: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.fed = 0
+        self.broken = False
+
+    # -- producer side (smart_download) --
+
+    def start(self, total: int) -> None:
+        if not self.size.done():
+            self.size.set_result(total)
+
+    async def feed(self, chunk: bytes) -> None:
+        if not self.broken:
+            self.fed += len(chunk)
+            await self._queue.put(chunk)  # bounded → download paces the upload
+
+    async def finish(self) -> None:
+        if not self.broken:
+            await self._queue.put(None)
+
+    def reset(self) -> None:
+        """Stop mirroring; wake both sides so nobody blocks on the queue."""
+        if self.broken:
+            return
+        self.broken = True
+        if not self.size.done():
+            self.size.set_result(-1)
+        while True:
+            try:
+                self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+        try:
+            self._queue.put_nowait(_TEE_RESET)
+        except asyncio.QueueFull:
+            pass
+
+    # -- consumer side (upload) --
+
+    async def stream(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            if item is _TEE_RESET:
+                raise RuntimeError("stream tee reset — use the staged file instead")
+            yield item
+
 # ---------- Internals ----------
 
 def _rng_delay(attempt: int) -> float:
@@ -92,9 +176,22 @@ async def _probe_headers(client: httpx.AsyncClient, url: str) -> tuple[int, bool
         pass
     return size, ranged
 
+# Origins that reliably honour Range and report Content-Length on a plain
+# GET — probing them first only adds an extra round-trip per URL
+_KNOWN_RANGED_HOSTS = (
+    ".amazonaws.com",
+    ".cloudflarestorage.com",
+    ".backblazeb2.com",
+    ".digitaloceanspaces.com",
+)
+
+def _host_supports_range(url: str) -> bool:
+    host = (urlparse(url).hostname or "").lower()
+    return host.endswith(_KNOWN_RANGED_HOSTS)
+
 # ---------- Downloader ----------
 
-async def smart_download(url: str, out_path: str, *args, progress=None, chunk_size: int = CHUNK_SIZE, **kwargs) -> str:
+async def smart_download(url: str, out_path: str, *args, progress=None, chunk_size: int = CHUNK_SIZE, sink: _StreamTee | None = None, client: httpx.AsyncClient | None = None, **kwargs) -> str:
     """
     Robust single-file downloader with resume and long timeouts.
 
@@ -104,6 +201,11 @@ async def smart_download(url: str, out_path: str, *args, progress=None, chunk_si
     out_path : str
     progress : Optional[callable(total:int|None, downloaded:int)]; called periodically.
                (If callers pass a 3rd positional arg as a callback, we’ll accept that too.)
+    sink : Optional[_StreamTee]; receives every chunk as it lands on disk so a
+           consumer can upload in parallel. Reset whenever the byte stream
+           can't stay contiguous (resume, Range ignored, unknown size).
+    client : Optional[httpx.AsyncClient]; defaults to the process-wide shared
+             client from http_clients, so batches reuse warm connections.
 
     Returns
     -------
@@ -114,78 +216,188 @@ async def smart_download(url: str, out_path: str, *args, progress=None, chunk_si
         maybe_cb = args[0]
         if callable(maybe_cb):
             progress = maybe_cb
+    # Resolve callability once — the chunk loop then only does a None check
+    if not callable(progress):
+        progress = None
 
     os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
 
-    limits  = httpx.Limits(max_connections=8, max_keepalive_connections=8)
-    timeout = httpx.Timeout(
-        connect=CONNECT_TIMEOUT,
-        read=READ_TIMEOUT,
-        write=WRITE_TIMEOUT,
-        pool=POOL_TIMEOUT,
-    )
-
-    async with httpx.AsyncClient(http2=True, timeout=timeout, limits=limits) as client:
-        total_size, ranged = await _probe_headers(client, url)
-
-        # Early exit: if file already complete
-        if total_size > 0 and os.path.exists(out_path) and os.path.getsize(out_path) >= total_size:
-            if callable(progress):
-                await _maybe_await(progress, total_size, total_size)
-            return out_path
+    # Shared process-wide pools unless the caller injects its own client —
+    # no per-download TLS handshakes, warm keep-alives across a queued batch.
+    # Probes ride the HTTP/2 client; the body stream gets the HTTP/1.1 one so
+    # concurrent transfers use separate sockets instead of sharing one
+    # head-of-line-blocked connection.
+    if client is not None:
+        probe_client = stream_client = client
+    else:
+        probe_client = http_clients.get_client()
+        stream_client = http_clients.get_download_client()
 
-        attempt = 0
-        while True:
+    # Known-good CDNs skip the HEAD/1-byte probe entirely; the size is
+    # learned from the first real response's headers instead
+    skip_probe = _host_supports_range(url)
+    if skip_probe:
+        total_size, ranged = -1, True
+    else:
+        total_size, ranged = await _probe_headers(probe_client, url)
+
+    # Early exit: if file already complete
+    if total_size > 0 and os.path.exists(out_path) and os.path.getsize(out_path) >= total_size:
+        if sink is not None:
+            sink.reset()
+        if progress is not None:
+            await _maybe_await(progress, total_size, total_size)
+        return out_path
+
+    if sink is not None:
+        if total_size > 0:
+            sink.start(total_size)
+        elif not skip_probe:
+            sink.reset()  # sized upload impossible without a known length
+        # else: deferred — the first response's headers resolve the size
+
+    attempt = 0
+    while True:
+        try:
+            # Figure out how much we have and attempt to resume — one stat
+            # answers both "does it exist" and "how much is there"
+            headers = {}
             try:
-                # Figure out how much we have and attempt to resume
+                downloaded = os.stat(out_path).st_size
+            except FileNotFoundError:
                 downloaded = 0
-                headers = {}
-                mode = "r+b" if os.path.exists(out_path) else "w+b"
-                with open(out_path, mode) as fp:
-                    if os.path.exists(out_path):
-                        downloaded = fp.seek(0, os.SEEK_END)
-
-                    if downloaded > 0 and ranged:
-                        headers["Range"] = f"bytes={downloaded}-"
-
-                    async with client.stream("GET", url, headers=headers, follow_redirects=True) as r:
-                        if r.status_code not in (200, 206):
-                            r.raise_for_status()
-
-                        # If we resumed but server ignored Range, we must rewrite from 0.
-                        if downloaded and r.status_code == 200:
-                            fp.seek(0)
-                            fp.truncate(0)
-                            downloaded = 0
-
-                        if callable(progress):
+            with open(out_path, "r+b" if downloaded else "w+b") as fp:
+                if downloaded:
+                    fp.seek(downloaded)
+
+                if sink is not None and downloaded != sink.fed:
+                    sink.reset()  # on-disk bytes the consumer never saw
+
+                # No transfer compression: gzip buys nothing on media payloads,
+                # would make resume byte offsets meaningless, and identity lets
+                # the read loop take the raw socket bytes without a decode copy
+                headers["Accept-Encoding"] = "identity"
+                if downloaded > 0 and ranged:
+                    headers["Range"] = f"bytes={downloaded}-"
+
+                async with stream_client.stream("GET", url, headers=headers, follow_redirects=True) as r:
+                    if r.status_code not in (200, 206):
+                        r.raise_for_status()
+
+                    # Probe was skipped — take the size from this response:
+                    # Content-Range carries the total on a 206, Content-Length
+                    # on a plain 200
+                    if total_size <= 0:
+                        if r.status_code == 206:
+                            cr = r.headers.get("Content-Range", "")
+                            if "/" in cr:
+                                try:
+                                    total_size = int(cr.split("/")[-1])
+                                except ValueError:
+                                    pass
+                        else:
+                            cl = r.headers.get("Content-Length")
+                            if cl and cl.isdigit():
+                                total_size = int(cl)
+                        if sink is not None and not sink.size.done():
+                            if total_size > 0:
+                                sink.start(total_size)
+                            else:
+                                sink.reset()  # still unknown → staged path only
+
+                    # A 206 must continue exactly where our file ends; a
+                    # server answering some other range would corrupt the tail
+                    if downloaded and r.status_code == 206:
+                        cr = r.headers.get("Content-Range", "")
+                        if not cr.startswith(f"bytes {downloaded}-"):
+                            raise RuntimeError(f"mismatched Content-Range {cr!r} (expected start {downloaded})")
+
+                    # If we resumed but server ignored Range, we must rewrite from 0.
+                    if downloaded and r.status_code == 200:
+                        fp.seek(0)
+                        fp.truncate(0)
+                        downloaded = 0
+                        if sink is not None:
+                            sink.reset()  # stream restarted from byte 0
+
+                    if progress is not None:
+                        await _maybe_await(progress, total_size if total_size > 0 else None, downloaded)
+
+                    # Downstream throttling already drops most ticks, but the
+                    # callback plumbing itself isn't free — only report every
+                    # PROGRESS_BYTES or once a second, whichever comes first
+                    last_report = downloaded
+                    last_t = time.monotonic()
+
+                    # File position already tracks `downloaded` (writes are
+                    # sequential; resume/rewrite seek explicitly above), so
+                    # no per-chunk seek — one flush+lseek less per MiB
+                    # identity is forced above, so raw socket bytes == content
+                    # bytes and the decoder pipeline (one copy per chunk) can
+                    # be bypassed entirely. Writes are batched in `buf`; an
+                    # aborted attempt just loses the unflushed tail, and the
+                    # resume logic re-reads the on-disk size anyway.
+                    buf = bytearray()
+                    async for chunk in r.aiter_raw(chunk_size=chunk_size):
+                        if not chunk:
+                            continue
+                        buf += chunk
+                        if len(buf) >= WRITE_COALESCE:
+                            # Off-loop write: a 4 MiB flush to a slow disk
+                            # (overlayfs, NFS) would stall every coroutine.
+                            # Writes are strictly sequential on a handle no
+                            # other task touches, so the offload is safe.
+                            await asyncio.to_thread(fp.write, buf)
+                            buf.clear()
+                        downloaded += len(chunk)
+                        if sink is not None:
+                            await sink.feed(chunk)
+                        if progress is not None and (
+                            downloaded - last_report >= PROGRESS_BYTES
+                            or time.monotonic() - last_t >= 1.0
+                        ):
                             await _maybe_await(progress, total_size if total_size > 0 else None, downloaded)
+                            last_report = downloaded
+                            last_t = time.monotonic()
+                    if buf:
+                        await asyncio.to_thread(fp.write, buf)
+                        buf.clear()
 
-                        async for chunk in r.aiter_bytes(chunk_size=chunk_size):
-                            if not chunk:
-                                continue
-                            fp.seek(downloaded)
-                            fp.write(chunk)
-                            downloaded += len(chunk)
-                            if callable(progress):
-                                await _maybe_await(progress, total_size if total_size > 0 else None, downloaded)
-
-                # Verify completeness if we know size; otherwise accept as done
-                if total_size > 0 and downloaded < total_size:
-                    # server closed early — loop and resume
-                    attempt += 1
-                    if attempt > MAX_RETRIES:
-                        raise RuntimeError(f"download stalled after {attempt} attempts; got {downloaded}/{total_size} bytes")
-                    await asyncio.sleep(_rng_delay(attempt))
-                    continue
-
-                return out_path
-
-            except Exception as e:
+            # Verify completeness if we know size; otherwise accept as done
+            if total_size > 0 and downloaded < total_size:
+                # server closed early — loop and resume
                 attempt += 1
                 if attempt > MAX_RETRIES:
-                    raise
+                    raise RuntimeError(f"download stalled after {attempt} attempts; got {downloaded}/{total_size} bytes")
                 await asyncio.sleep(_rng_delay(attempt))
+                continue
+
+            if progress is not None:
+                # Final report so the caller always sees the finished count
+                await _maybe_await(progress, total_size if total_size > 0 else None, downloaded)
+            if sink is not None:
+                await sink.finish()
+            return out_path
+
+        except httpx.HTTPStatusError as e:
+            # Only transient statuses are worth another round-trip; a 404 or
+            # 403 will not get better after 60s of backoff
+            code = e.response.status_code
+            if code not in (408, 429) and code < 500:
+                raise
+            attempt += 1
+            if attempt > MAX_RETRIES:
+                raise
+            await asyncio.sleep(_rng_delay(attempt))
+        except (httpx.TransportError, asyncio.TimeoutError):
+            # Connection drops, resets, timeouts — resume from what's on disk.
+            # Anything else (programming errors, mismatched Content-Range,
+            # disk failures) propagates immediately instead of burning the
+            # whole retry budget first.
+            attempt += 1
+            if attempt > MAX_RETRIES:
+                raise
+            await asyncio.sleep(_rng_delay(attempt))
 
 # helper: allow both sync/async progress callbacks
 async def _maybe_await(fn, total, downloaded):
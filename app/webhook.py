@@ -1,24 +1,149 @@
 from __future__ import annotations
+import asyncio
 import logging
-import os
+
+import orjson
+import uvicorn
+from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
-from .config import TELEGRAM_BOT_TOKEN, LOG_LEVEL, GOFILE_TOKENS, PORT, WEBHOOK_URL, BOT_API_BASE_URL
+from telegram.request import HTTPXRequest
+from . import config
+from .config import (
+    TELEGRAM_BOT_TOKEN, LOG_LEVEL, GOFILE_TOKENS, PORT, WEBHOOK_URL,
+    BOT_API_BASE_URL, MAX_CONCURRENT_TRANSFERS,
+)
 from .account_pool import AccountPool
+from .bot import _post_init, _post_shutdown
 from .handlers import start, help_cmd, stats, handle_incoming_file
 
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=getattr(logging, LOG_LEVEL, logging.INFO),
-)
+# libuv event loop for asyncio.run below — same guarded install as bot.py
+# (also reached transitively via the .bot import, but webhook mode must not
+# silently lose it if that import ever goes away). uvicorn's loop="auto"
+# picks uvloop up once installed.
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
+from .logsetup import setup as _setup_logging
+_setup_logging(LOG_LEVEL)
 log = logging.getLogger(__name__)
 
+# Combined media filter, built once at import (the | chain allocates filter
+# objects); documents first since they dominate an uploader bot's traffic
+# and PTB's or-filter short-circuits left to right
+MEDIA_FILTER = (
+    filters.Document.ALL |
+    filters.VIDEO |
+    filters.AUDIO |
+    filters.PHOTO
+)
+
+_OK = [
+    {"type": "http.response.start", "status": 200, "headers": []},
+    {"type": "http.response.body", "body": b""},
+]
+_NOT_FOUND = [
+    {"type": "http.response.start", "status": 404, "headers": []},
+    {"type": "http.response.body", "body": b""},
+]
+
+
+def _make_asgi(app):
+    """Minimal ASGI callable feeding Telegram updates into PTB's queue.
+
+    uvicorn's HTTP stack (keep-alive, httptools parsing) receives the
+    webhook POSTs; the handler itself only parses the body with orjson and
+    enqueues — all dispatch stays inside the running PTB Application.
+    """
+
+    async def asgi(scope, receive, send):
+        if scope["type"] == "lifespan":
+            # acknowledge startup/shutdown; PTB's lifecycle is managed outside
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        if scope["method"] != "POST" or scope["path"] != "/webhook":
+            for message in _NOT_FOUND:
+                await send(message)
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        await app.update_queue.put(Update.de_json(orjson.loads(body), app.bot))
+        for message in _OK:
+            await send(message)
+
+    return asgi
+
+
+async def _serve(app) -> None:
+    """Run PTB and the uvicorn webhook receiver side by side."""
+    await app.initialize()
+    # PTB only fires post_init/post_shutdown from run_polling/run_webhook;
+    # with this manual lifecycle we call them ourselves so webhook mode gets
+    # the same worker pool, shared session and executor as polling mode.
+    await _post_init(app)
+    log.info("Setting webhook to %s", WEBHOOK_URL)
+    await app.bot.set_webhook(url=WEBHOOK_URL)
+    await app.start()
+    server = uvicorn.Server(uvicorn.Config(
+        _make_asgi(app),
+        host="0.0.0.0",
+        port=PORT,
+        log_level="warning",
+    ))
+    try:
+        await server.serve()
+    finally:
+        await app.stop()
+        await _post_shutdown(app)
+        await app.shutdown()
+
+
 def main():
+    config.validate()
+
+    if not WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL is required for webhook mode")
+
     pool = AccountPool(GOFILE_TOKENS)
-    builder = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN)
-    
+
+    # A big keep-alive pool for outbound Bot API calls: every status edit and
+    # file download rides a warm connection instead of paying TLS setup, and
+    # concurrent transfers stop queueing on PTB's default pool of 1
+    req_kwargs = dict(
+        connection_pool_size=256,
+        pool_timeout=5.0,
+        connect_timeout=20.0,
+        read_timeout=60.0,
+        write_timeout=600.0,  # large uploads back to Telegram take a while
+    )
+    if BOT_API_BASE_URL:
+        # Local Bot API server → HTTP/2 multiplexing cuts connection churn
+        req_kwargs["http_version"] = "2"
+    builder = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .request(HTTPXRequest(**req_kwargs))
+        # Dispatch updates in parallel instead of PTB's sequential default —
+        # one slow transfer must not stall every later update
+        .concurrent_updates(MAX_CONCURRENT_TRANSFERS)
+    )
+
     if BOT_API_BASE_URL:  # only if non-empty
         builder = builder.base_url(BOT_API_BASE_URL.rstrip("/") + "/")
-    
+
     app = builder.build()
     app.bot_data["pool"] = pool
 
@@ -26,17 +151,9 @@ def main():
     app.add_handler(CommandHandler("help", help_cmd))
     app.add_handler(CommandHandler("stats", stats))
 
-    app.add_handler(MessageHandler(
-        filters.Document.ALL | filters.VIDEO | filters.AUDIO | filters.PHOTO,
-        handle_incoming_file
-    ))
+    app.add_handler(MessageHandler(MEDIA_FILTER, handle_incoming_file, block=False))
 
-    # Set webhook
-    if not WEBHOOK_URL:
-        raise RuntimeError("WEBHOOK_URL is required for webhook mode")
-
-    log.info("Setting webhook to %s", WEBHOOK_URL)
-    app.run_webhook(listen="0.0.0.0", port=PORT, url_path="webhook", webhook_url=f"{WEBHOOK_URL}")
+    asyncio.run(_serve(app))
 
 if __name__ == "__main__":
     main()